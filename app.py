@@ -4,11 +4,31 @@ import numpy as np
 import plotly.express as px
 import urllib.parse
 import requests
-from datetime import datetime, timedelta
-from pymongo import MongoClient
+import httpx
+import atexit
+import hashlib
+import heapq
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import dropwhile, takewhile
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, WriteConcern
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from collections.abc import MutableMapping
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+########## --- Appliance Model ---############
+@dataclass(slots=True)
+class Appliance:
+    name: str
+    watt: int
+    hours: float
 
 ########## --- MongoDB Setup ---############
 @st.cache_resource(ttl=600)
@@ -21,104 +41,314 @@ def get_mongo_client():
     except Exception as e:
         st.error(f"MongoDB connection failed: {e}")
         return None
+
+# Collection handles are resolved once per client; writes go through the batch buffer below, so they are unacknowledged
+def get_collections():
+    client = get_mongo_client()
+    if client is None:
+        raise ConnectionError("MongoDB client is not connected")
+    return get_client_collections(client, id(client))
+
+# Keyed on the client's identity so the handles are rebuilt whenever get_mongo_client() builds a new client;
+# max_entries=1 releases the previous client's handles (and with them the old client) at that point
+@st.cache_resource(max_entries=1)
+def get_client_collections(_client, client_id):
+    db = _client.smart_energy_db
+    unacknowledged = WriteConcern(w=0)
+    return {
+        "env": db.get_collection("environment_telemetry_ts", write_concern=unacknowledged),
+        "profiles": db.get_collection("usage_profiles", write_concern=unacknowledged),
+        "decisions": db.get_collection("ai_decision_log", write_concern=unacknowledged),
+    }
+
+# Telemetry/decision documents are buffered and written in batches instead of one insert per rerun
+FLUSH_THRESHOLD = 50  # documents
+FLUSH_INTERVAL = 30  # seconds a document may wait before it is flushed
+MAX_PENDING = 1000  # per collection; oldest documents are dropped beyond this while MongoDB is unavailable
+
+@st.cache_resource
+def get_write_buffer():
+    buffer = {
+        "pending": {"env": [], "profiles": [], "decisions": []},
+        "oldest": {},  # monotonic time the oldest pending document was queued
+        "retry_at": {},  # after a failed insert, no size-triggered flush before this time
+        "lock": threading.Lock(),
+    }
+    atexit.register(flush_all_pending, buffer)
+    return buffer
+
+def flush_pending(buffer, coll_name):
+    # Caller must hold buffer["lock"]; documents stay buffered until the insert succeeds
+    docs = buffer["pending"][coll_name]
+    if not docs:
+        return
+    try:
+        get_collections()[coll_name].insert_many(docs, ordered=False)
+    except Exception as e:
+        # Retry after another interval; cap the backlog so an outage cannot grow it without bound
+        buffer["oldest"][coll_name] = time.monotonic()
+        buffer["retry_at"][coll_name] = time.monotonic() + FLUSH_INTERVAL
+        if len(docs) > MAX_PENDING:
+            dropped = len(docs) - MAX_PENDING
+            del docs[:dropped]
+            st.sidebar.warning(f"Dropped {dropped} unsent {coll_name} documents")
+        st.sidebar.warning(f"Deferred MongoDB write ({coll_name}): {e}")
+        return
+    buffer["pending"][coll_name] = []
+    buffer["oldest"].pop(coll_name, None)
+
+def flush_all_pending(buffer):
+    with buffer["lock"]:
+        for coll_name in buffer["pending"]:
+            flush_pending(buffer, coll_name)
+
+def flush_due():
+    # Called on every rerun so a lone document does not wait for the next write to be flushed
+    buffer = get_write_buffer()
+    now = time.monotonic()
+    with buffer["lock"]:
+        for coll_name, docs in buffer["pending"].items():
+            if docs and now - buffer["oldest"][coll_name] > FLUSH_INTERVAL:
+                flush_pending(buffer, coll_name)
+
+def queue_write(coll_name, doc, threshold=FLUSH_THRESHOLD):
+    buffer = get_write_buffer()
+    with buffer["lock"]:
+        pending = buffer["pending"][coll_name]
+        if not pending:
+            buffer["oldest"][coll_name] = time.monotonic()
+        pending.append(doc)
+        if len(pending) >= threshold and time.monotonic() >= buffer["retry_at"].get(coll_name, 0):
+            flush_pending(buffer, coll_name)
+
+########## --- HTTP Session (keep-alive + retries) ---############
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    return session
+
+# OpenWeather calls share one HTTP/2 connection, multiplexed across the concurrent fetches and kept alive between reruns
+@st.cache_resource
+def get_weather_client():
+    return httpx.Client(timeout=5, transport=httpx.HTTPTransport(http2=True, retries=3))
 ################---Definition of Variable----#############
+CITIES_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "smart-energy")
+CITIES_COLUMNS = {"city": str, "iso2": str, "population": "Int32"}
+CITIES_CACHE_VERSION = 2  # bump when the cached DataFrame's contents/format change
+
+def read_cities_csv(url, encoding):
+    # Stream the download straight into the parser; only the needed columns are parsed
+    with get_http_session().get(url, stream=True, timeout=10) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return pd.read_csv(
+            response.raw, encoding=encoding, on_bad_lines='skip',
+            usecols=lambda column: column in CITIES_COLUMNS, dtype=CITIES_COLUMNS,
+            # "NA" is Namibia's ISO code, so only an empty population counts as missing
+            keep_default_na=False, na_values={"population": [""]}
+        )
+
 @st.cache_data
 def load_cities(filepath="https://raw.githubusercontent.com/ogatech4real/smart-energy-optimiser/main/worldcities.csv", limit=5000):
+    # Pre-sorted top-N cities are kept on disk so cold starts skip the download and CSV parse;
+    # the source is part of the file name so a different/updated CSV location gets its own cache
+    source_hash = hashlib.sha1(filepath.encode("utf-8")).hexdigest()[:12]
+    cache_path = os.path.join(CITIES_CACHE_DIR, f"cities_v{CITIES_CACHE_VERSION}_{source_hash}_{limit}.parquet")
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            # Unreadable cache (e.g. truncated write): drop it and rebuild from the CSV
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
     try:
-        df = pd.read_csv(filepath, encoding="utf-8", on_bad_lines='skip')
+        df = read_cities_csv(filepath, encoding="utf-8")
     except UnicodeDecodeError:
-        df = pd.read_csv(filepath, encoding="ISO-8859-1", on_bad_lines='skip')
+        df = read_cities_csv(filepath, encoding="ISO-8859-1")
     except pd.errors.ParserError:
         st.error("🚨 Error parsing the cities CSV file. Some rows were skipped due to malformed structure.")
         st.stop()
 
     # Validate required columns
-    required_columns = {'city', 'iso2', 'population'}
+    required_columns = set(CITIES_COLUMNS)
     if not required_columns.issubset(df.columns):
         st.error(f"❌ CSV is missing required columns: {required_columns - set(df.columns)}")
         st.stop()
 
-    df_sorted = df.sort_values(by="population", ascending=False).head(limit)
-    df_sorted["display_name"] = df_sorted["city"].str.strip() + ", " + df_sorted["iso2"].str.strip()
+    df = df.dropna(subset=["city", "iso2"])
+    df = df.assign(city=df["city"].str.strip(), iso2=df["iso2"].str.strip())
+    # Rows without a city or country code can't form a "City, CC" option for the location selectbox
+    df = df[df["city"].ne("") & df["iso2"].ne("")]
+    df_sorted = df.nlargest(limit, "population")
+    df_sorted["display_name"] = df_sorted["city"].str.cat(df_sorted["iso2"], sep=", ")
+    df_sorted = df_sorted[["city", "iso2", "population", "display_name"]]
+    try:
+        os.makedirs(CITIES_CACHE_DIR, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partially written cache
+        fd, tmp_path = tempfile.mkstemp(dir=CITIES_CACHE_DIR, suffix=".parquet.tmp")
+        os.close(fd)
+        try:
+            df_sorted.to_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except Exception as e:
+        # The disk cache is best-effort (pyarrow errors are not OSErrors); the freshly loaded cities are still returned
+        st.sidebar.warning(f"Could not write cities cache: {e}")
     return df_sorted
 
-def fetch_weather(location_param, api_key):
+# Errors are raised rather than returned so a failed lookup is never cached; the API key is excluded from the cache key
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_weather(location_param, _api_key):
     url = f"https://api.openweathermap.org/data/2.5/weather"
+    params = {"q": location_param, "appid": _api_key, "units": "metric"}
+    response = get_weather_client().get(url, params=params)
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.status_code} - {response.text}")
+    return response.json()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_tomorrow_weather_forecast(location_param, api_key):
+    url = "https://api.openweathermap.org/data/2.5/forecast"
     params = {"q": location_param, "appid": api_key, "units": "metric"}
-    try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.sidebar.error(f"Weather API error: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        st.sidebar.error(f"Weather API Exception: {e}")
-        return None
+    response = get_weather_client().get(url, params=params)
+    if response.status_code == 200:
+        data = response.json()
+        tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).date()
+        tomorrow_start = int(datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc).timestamp())
+        tomorrow_end = tomorrow_start + 86400
+        # Entries are in time order, so compare raw epoch seconds and stop as soon as tomorrow is over
+        entries = dropwhile(lambda entry: entry["dt"] < tomorrow_start, data["list"])
+        return list(takewhile(lambda entry: entry["dt"] < tomorrow_end, entries))
+    else:
+        st.error(f"Forecast API error: {response.status_code}")
+        return []
+
+def estimate_tomorrow_solar_kwh(forecast_list, solar_capacity, efficiency_percent):
+    clouds = np.fromiter((entry["clouds"]["all"] for entry in forecast_list), dtype=np.int16)
+    if clouds.size == 0:
+        return 0.0
+    avg_irradiance = float(np.clip(100 - clouds, 0, None).mean()) * 10  # W/m²
+    # Estimate equivalent full-sun hours from average irradiance (assuming 1000 W/m² as 1 sun hour)
+    sun_hours = avg_irradiance / 1000 * clouds.size / 3  # 3-hour intervals
+    return round((solar_capacity * (efficiency_percent / 100) * sun_hours) / 1000, 2)  # kWh
+
+@st.cache_resource
+def get_pool():
+    return ThreadPoolExecutor(max_workers=4)
+
+def submit_with_context(fn, *args):
+    # Worker threads need the script run context to use st.* calls and caches
+    ctx = get_script_run_ctx()
+    def run():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(*args)
+        finally:
+            # Pool threads are shared across sessions; don't keep this session's context alive
+            if hasattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME):
+                delattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME)
+    return get_pool().submit(run)
 
-def log_environment_data(location, weather_data):
+def log_environment_data(location, weather_data, timestamp=None):
     try:
-        client = get_mongo_client()
-        db = client.smart_energy_db
-        telemetry = db.environment_telemetry
         doc = {
             "location": location,
-            "timestamp": datetime.utcnow(),
+            "timestamp": timestamp or datetime.now(timezone.utc),
             "temperature": weather_data.get("Temperature (°C)"),
             "humidity": weather_data.get("Humidity (%)"),
             "cloud_cover": weather_data.get("Cloud Cover (%)"),
             "solar_irradiance": weather_data.get("Solar Irradiance (Est) W/m²")
         }
-        telemetry.insert_one(doc)
+        queue_write("env", doc)
+        return True
     except Exception as e:
         st.sidebar.error(f"Failed to log telemetry data: {e}")
+        return False
 
+# Same TTL as the client so the check is retried once MongoDB becomes reachable again
+@st.cache_resource(ttl=600)
 def ensure_timeseries_collection():
     client = get_mongo_client()
+    if client is None:
+        return
     db = client.smart_energy_db
     if "environment_telemetry_ts" not in db.list_collection_names():
         try:
             db.create_collection(
                 "environment_telemetry_ts",
-                timeseries={"timeField": "timestamp", "metaField": "location", "granularity": "hours"}
+                timeseries={"timeField": "timestamp", "metaField": "location", "granularity": "minutes"}
             )
         except Exception as e:
             st.sidebar.warning(f"Timeseries collection creation warning: {e}")
+    # Serve the latest-N-per-location history query straight from an index
+    try:
+        db.environment_telemetry_ts.create_index([("location", 1), ("timestamp", -1)])
+        db.ai_decision_log.create_index([("timestamp", -1)])
+    except Exception as e:
+        st.sidebar.warning(f"Index creation warning: {e}")
 
-def fetch_telemetry_history(limit=48):
-    client = get_mongo_client()
-    db = client.smart_energy_db
-    telemetry = db.environment_telemetry
-    data = list(telemetry.find().sort("timestamp", -1).limit(limit))
-    return pd.DataFrame(data)
+@st.cache_data(ttl=60)
+def fetch_telemetry_history(location, limit=48):
+    cursor = get_collections()["env"].find(
+        {"location": location},
+        projection={"_id": 0, "timestamp": 1, "temperature": 1, "solar_irradiance": 1}
+    ).sort("timestamp", -1).limit(limit)
+    return pd.DataFrame.from_records(cursor, columns=["timestamp", "temperature", "solar_irradiance"])
 
-def log_user_profile(appliances, battery_capacity, solar_capacity):
-    client = get_mongo_client()
-    db = client.smart_energy_db
-    usage_profiles = db.usage_profiles
+def log_user_profile(appliances, battery_capacity, solar_capacity, timestamp=None):
     profile = {
-        "timestamp": datetime.utcnow(),
-        "appliances": appliances,
+        "timestamp": timestamp or datetime.now(timezone.utc),
+        "appliances": {a.name: {"watt": a.watt, "hours": a.hours} for a in appliances},
         "system_config": {
             "battery_capacity_Wh": battery_capacity,
             "solar_capacity_W": solar_capacity
         }
     }
-    usage_profiles.insert_one(profile)
+    queue_write("profiles", profile)
 
-def log_ai_decision(input_summary, recommendation, confidence=1.0, model="heuristic", reason=None):
-    client = get_mongo_client()
-    db = client.smart_energy_db
-    decisions = db.ai_decision_log
+def log_ai_decision(input_summary, recommendation, confidence=1.0, model="heuristic", reason=None, timestamp=None):
     log = {
-        "timestamp": datetime.utcnow(),
+        "timestamp": timestamp or datetime.now(timezone.utc),
         "input_summary": input_summary,
         "recommendation": recommendation,
         "confidence_score": confidence,
         "decision_model": model,
         "explanation": reason or "Rule-based heuristic"
     }
-    decisions.insert_one(log)
+    queue_write("decisions", log)
+
+def changed_signature(name, *values):
+    # Every widget interaction reruns main(), so only log when the logged inputs actually changed;
+    # returns the new signature, or None when it matches the last successfully logged one
+    sig = hash(values)
+    if st.session_state.get(f"last_hash_{name}") == sig:
+        return None
+    return sig
+
+def mark_logged(name, sig):
+    # Record the signature only after the write went through, so a failed write is retried next rerun
+    st.session_state[f"last_hash_{name}"] = sig
+
+@st.cache_data
+def budget_figure(budget_records):
+    budget_df = pd.DataFrame(list(budget_records), columns=["Time Block", "Solar Forecast (kWh)", "Scheduled Load (kWh)"])
+    return px.bar(
+        budget_df.melt(id_vars="Time Block", var_name="Metric", value_name="kWh"),
+        x="Time Block", y="kWh", color="Metric", barmode="group",
+        title="Solar Generation vs Appliance Load"
+    )
 ###############################################################################
 ### --- App Config ---####
 st.set_page_config(page_title="Smart Energy Optimiser", layout="wide")
@@ -126,6 +356,12 @@ st.title("🔋Smart Energy Optimiser")
 
 ########## --- Main App Execution Function ---################################
 def main():
+    # ⏱ Ensure MongoDB telemetry collection (runs once per process)
+    ensure_timeseries_collection()
+    flush_due()
+    api_key = st.secrets["openweathermap"]["api_key"]
+    now = datetime.now(timezone.utc)  # shared timestamp for every document logged in this run
+
     # Sidebar System Configuration
     st.sidebar.header("⚙️Configure System")
     st.sidebar.caption("🔌Insert your System Details Here")
@@ -145,7 +381,7 @@ def main():
             "Heating/Cooling": ["Electric Heater (1500W)", "Fan (70W)", "Air Conditioner (2000W)"],
             "OtherApliance": ["Other (W)"]
         }
-        selected_appliances = {}
+        appliances = []
         st.caption("🔌Select Appliances and Estimate Hourly Usage")
         for category, items in appliance_categories.items():
             with st.expander(category):
@@ -161,13 +397,17 @@ def main():
                     with ap_col3:
                         hours = st.number_input(f"Hours", min_value=0.0, max_value=24.0, value=4.0, step=0.5, key=f"{item}_hrs")
                     if use:
-                        selected_appliances[item] = {"watt": custom_watt, "hours": hours}
+                        appliances.append(Appliance(item, custom_watt, hours))
 
     # ---- Section 2: Simulation Engine ----
     with col2:
         st.subheader("🔋Simulation")
         st.caption("🔌Today's Estimated Load & Forecasted Energy")
-        total_load_wh = sum(a['watt'] * a['hours'] for a in selected_appliances.values())
+        watts = np.fromiter((a.watt for a in appliances), dtype=np.float32, count=len(appliances))
+        hours = np.fromiter((a.hours for a in appliances), dtype=np.float32, count=len(appliances))
+        total_load_wh = float(watts @ hours)
+        # Highest-wattage appliances, shared by today's and tomorrow's advisories
+        top_consumers = heapq.nlargest(3, appliances, key=lambda a: a.watt)
         solar_input_kwh = (solar_capacity * (panel_efficiency / 100)) * 5 / 1000  # Assuming 5 sun hours
         total_available_energy = min(battery_capacity / 1000 + solar_input_kwh, battery_capacity / 1000)
         remaining_energy = total_available_energy - (total_load_wh / 1000)
@@ -195,7 +435,22 @@ def main():
     location_param = f"{city},{country}"
     
     # ✅ Weather fetch now happens outside too — ensures consistent weather_data access
-    weather_data_raw = fetch_weather(location_param, st.secrets["openweathermap"]["api_key"])
+    # Today's and tomorrow's weather are independent, so fetch both concurrently
+    weather_future = submit_with_context(fetch_weather, location_param, api_key)
+    forecast_future = submit_with_context(fetch_tomorrow_weather_forecast, location_param, api_key)
+    try:
+        weather_data_raw = weather_future.result()
+    except RuntimeError as e:
+        st.sidebar.error(f"Weather API error: {e}")
+        weather_data_raw = None
+    except Exception as e:
+        st.sidebar.error(f"Weather API Exception: {e}")
+        weather_data_raw = None
+    try:
+        tomorrow_forecast = forecast_future.result()
+    except Exception as e:
+        st.sidebar.error(f"Forecast API Exception: {e}")
+        tomorrow_forecast = []
     weather_data = {}
     if weather_data_raw:
         weather_data = {
@@ -210,61 +465,34 @@ def main():
     # 💡 Smart advisory logic follows now
     if remaining_energy < 0:
         st.warning("⚠️ Energy Deficit Detected! Reduce load or reschedule usage to peak solar hours.")
-        high_consumers = sorted(selected_appliances.items(), key=lambda x: x[1]['watt'], reverse=True)
         st.subheader("Suggested Load Rationalization:")
-        for item, data in high_consumers[:3]:
-            st.write(f"• Consider reducing hours for **{item}** ({data['watt']}W)")
+        for appliance in top_consumers:
+            st.write(f"• Consider reducing hours for **{appliance.name}** ({appliance.watt}W)")
     else:
         st.success("✅ Energy is sufficient for today's usage pattern.")
         if remaining_energy > 1:
             st.info("🔋 You have surplus energy. Consider running optional appliances or charging devices during the day.")
     
-    # ⏱ Ensure MongoDB telemetry collection
-    ensure_timeseries_collection()
-
     #### -- Final Decision Logging --########
     decision_note = "Reduce load or reschedule" if remaining_energy < 0 else "Run optional devices"
-    log_ai_decision(
-        input_summary={"total_load_Wh": total_load_wh, "remaining_energy_kWh": remaining_energy},
-        recommendation=decision_note,
-        confidence=0.95,
-        model="heuristic",
-        reason="based on solar input and usage profile"
-    )
+    decision_sig = changed_signature("decision", round(remaining_energy, 2), decision_note)
+    if decision_sig is not None:
+        log_ai_decision(
+            input_summary={"total_load_Wh": total_load_wh, "remaining_energy_kWh": remaining_energy},
+            recommendation=decision_note,
+            confidence=0.95,
+            model="heuristic",
+            reason="based on solar input and usage profile",
+            timestamp=now
+        )
+        mark_logged("decision", decision_sig)
 ###############-------------------------####################################
     # -------- Tomorrow's Forecast Advisory --------
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("🌤️Next-Day Forecast")
         st.caption("🔌Tomorrow's Solar Forecast and Expected Energy")
-        @st.cache_data(ttl=3600)
-        def fetch_tomorrow_weather_forecast(location_param, api_key):
-            url = "https://api.openweathermap.org/data/2.5/forecast"
-            params = {"q": location_param, "appid": api_key, "units": "metric"}
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                tomorrow = datetime.utcnow().date() + timedelta(days=1)
-                return [entry for entry in data["list"] if datetime.utcfromtimestamp(entry["dt"]).date() == tomorrow]
-            else:
-                st.error(f"Forecast API error: {response.status_code}")
-                return []
-
-        def estimate_tomorrow_solar_kwh(forecast_list, solar_capacity, efficiency_percent):
-            irradiance_estimates = []
-            for entry in forecast_list:
-                clouds = entry["clouds"]["all"]
-                est_irradiance = max(0, (100 - clouds) * 10)  # W/m²
-                irradiance_estimates.append(est_irradiance)
-            if irradiance_estimates:
-                avg_irradiance = np.mean(irradiance_estimates)
-                # Estimate equivalent full-sun hours from average irradiance (assuming 1000 W/m² as 1 sun hour)
-                sun_hours = avg_irradiance / 1000 * len(irradiance_estimates) / 3  # 3-hour intervals
-                return round((solar_capacity * (efficiency_percent / 100) * sun_hours) / 1000, 2)  # kWh
-            return 0.0
-
         # --- Execute Forecast Advisory ---
-        tomorrow_forecast = fetch_tomorrow_weather_forecast(location_param, st.secrets["openweathermap"]["api_key"])
         if tomorrow_forecast:
             est_solar_kwh = estimate_tomorrow_solar_kwh(tomorrow_forecast, solar_capacity, panel_efficiency)
             est_total_energy_kwh = min(battery_capacity / 1000 + est_solar_kwh, battery_capacity / 1000)
@@ -276,37 +504,44 @@ def main():
 
             if tomorrow_remaining_energy < 0:
                 st.warning("⚠️ Projected energy shortfall tomorrow. Consider adjusting appliance usage.")
-                high_drain = sorted(selected_appliances.items(), key=lambda x: x[1]['watt'], reverse=True)
                 st.markdown("**🔧 Suggested Adjustments for Tomorrow:**")
-                for item, data in high_drain[:3]:
-                    st.write(f"• Reduce usage of **{item}** ({data['watt']}W x {data['hours']}h)")
-
-                log_ai_decision(
-                    input_summary={
-                        "forecasted_solar_kWh": est_solar_kwh,
-                        "expected_total_energy": est_total_energy_kwh,
-                        "tomorrow_remaining_energy": tomorrow_remaining_energy
-                    },
-                    recommendation="Reduce or shift high-power appliances",
-                    confidence=0.90,
-                    model="forecast-advisor",
-                    reason="based on tomorrow's irradiance forecast"
-                )
+                for appliance in top_consumers:
+                    st.write(f"• Reduce usage of **{appliance.name}** ({appliance.watt}W x {appliance.hours}h)")
+
+                forecast_decision_sig = changed_signature("forecast_decision", round(tomorrow_remaining_energy, 2), "Reduce or shift high-power appliances")
+                if forecast_decision_sig is not None:
+                    log_ai_decision(
+                        input_summary={
+                            "forecasted_solar_kWh": est_solar_kwh,
+                            "expected_total_energy": est_total_energy_kwh,
+                            "tomorrow_remaining_energy": tomorrow_remaining_energy
+                        },
+                        recommendation="Reduce or shift high-power appliances",
+                        confidence=0.90,
+                        model="forecast-advisor",
+                        reason="based on tomorrow's irradiance forecast",
+                        timestamp=now
+                    )
+                    mark_logged("forecast_decision", forecast_decision_sig)
             else:
                 st.success("✅ Sufficient energy expected tomorrow based on forecast.")
                 st.info("📌 Consider shifting some flexible loads to tomorrow if surplus persists.")
 
-                log_ai_decision(
-                    input_summary={
-                        "forecasted_solar_kWh": est_solar_kwh,
-                        "expected_total_energy": est_total_energy_kwh,
-                        "tomorrow_remaining_energy": tomorrow_remaining_energy
-                    },
-                    recommendation="Optional appliance usage encouraged",
-                    confidence=0.90,
-                    model="forecast-advisor",
-                    reason="adequate energy projected for next day"
-                )
+                forecast_decision_sig = changed_signature("forecast_decision", round(tomorrow_remaining_energy, 2), "Optional appliance usage encouraged")
+                if forecast_decision_sig is not None:
+                    log_ai_decision(
+                        input_summary={
+                            "forecasted_solar_kWh": est_solar_kwh,
+                            "expected_total_energy": est_total_energy_kwh,
+                            "tomorrow_remaining_energy": tomorrow_remaining_energy
+                        },
+                        recommendation="Optional appliance usage encouraged",
+                        confidence=0.90,
+                        model="forecast-advisor",
+                        reason="adequate energy projected for next day",
+                        timestamp=now
+                    )
+                    mark_logged("forecast_decision", forecast_decision_sig)
 
     with col2:
         st.header("📅Energy Budgeting")
@@ -341,15 +576,16 @@ def main():
     # Forecast Chart
     st.subheader("📊Energy Flow Forecast")
     st.caption("🔌The chart shows your Load impact on you solar generation.")
+    hour_labels = pd.date_range(pd.Timestamp.now().floor("h"), periods=24, freq="h").strftime("%H:%M")
     st.bar_chart(pd.DataFrame({
-        "Solar Generation (kWh)": np.linspace(0, solar_input_kwh, 24),
-        "Load Consumption (kWh)": np.linspace(0, total_load_wh / 1000, 24)
-    }, index=[(datetime.now() + timedelta(hours=i)).strftime("%H:%M") for i in range(24)]))
+        "Solar Generation (kWh)": np.linspace(0, solar_input_kwh, 24, dtype=np.float32),
+        "Load Consumption (kWh)": np.linspace(0, total_load_wh / 1000, 24, dtype=np.float32)
+    }, index=hour_labels))
 
     # -- Historical Trend Visualization --
     st.subheader("📊Telemetry History & Solar Trend")
     st.caption("🔌The chart shows the Trend of temperature & solar strength")
-    history_df = fetch_telemetry_history()
+    history_df = fetch_telemetry_history(location_param)
     if not history_df.empty:
         history_df["timestamp"] = pd.to_datetime(history_df["timestamp"])
         history_df = history_df.sort_values("timestamp")
@@ -362,24 +598,28 @@ def main():
 
     st.markdown("### 📊 Energy Budget vs Appliance Load")
     st.caption("🔌Simulated bar chart for planned vs available energy")
-    budget_df = pd.DataFrame({
-        "Time Block": ["Morning", "Afternoon", "Evening"],
-        "Solar Forecast (kWh)": [3.5, 2.0, 1.0],
-        "Scheduled Load (kWh)": [2.0, 2.5, 0.5],
-    })
-    fig2 = px.bar(
-        budget_df.melt(id_vars="Time Block", var_name="Metric", value_name="kWh"),
-        x="Time Block", y="kWh", color="Metric", barmode="group",
-        title="Solar Generation vs Appliance Load"
+    budget_records = (
+        ("Morning", 3.5, 2.0),
+        ("Afternoon", 2.0, 2.5),
+        ("Evening", 1.0, 0.5),
     )
+    fig2 = budget_figure(budget_records)
     st.plotly_chart(fig2, use_container_width=True)
 
     # Log user configuration
-    st.session_state.user_profile = log_user_profile(selected_appliances, battery_capacity, solar_capacity)
+    profile_inputs = tuple((a.name, a.watt, a.hours) for a in appliances)
+    profile_sig = changed_signature("profile", profile_inputs, battery_capacity, solar_capacity)
+    if profile_sig is not None:
+        st.session_state.user_profile = log_user_profile(appliances, battery_capacity, solar_capacity, timestamp=now)
+        mark_logged("profile", profile_sig)
     st.write("User profile logged:", st.session_state.user_profile)
 
     # Log telemetry asynchronously or synchronously here
-    log_environment_data(location_param, weather_data)
+    # Nothing to log when the weather fetch failed
+    if weather_data:
+        telemetry_sig = changed_signature("telemetry", location_param, *(round(v, 1) for v in weather_data.values()))
+        if telemetry_sig is not None and log_environment_data(location_param, weather_data, timestamp=now):
+            mark_logged("telemetry", telemetry_sig)
 
 st.caption("Smart Energy Usage Optimiser – Leveraging on Google Cloud Solutions")
 st.caption("This solution is a cloud-based, AI-powered advisory platform that leverages real-time weather forecasts, solar modeling, battery management, and appliance profiling to help off-grid and smart home users maximize solar energy efficiency and sustainability. Read more: https://bit.ly/4evJ6nT")